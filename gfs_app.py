@@ -1,14 +1,9 @@
+import orjson
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import requests
-import xarray as xr
-from datetime import datetime, timedelta
-import io
-import base64
+from datetime import datetime
 
 # Konfigurasi halaman
 st.set_page_config(
@@ -51,117 +46,167 @@ forecast_hours = st.sidebar.selectbox(
     help="Pilih periode prediksi curah hujan"
 )
 
+# Batas minimum jumlah titik sebelum beralih ke render WebGL (scattergl).
+# Di bawah ini SVG tetap dipakai karena marker lebih tajam.
+MIN_SCATTERGL_ROWS = 1000
+
 # Fungsi untuk mengambil data dari NOAA
 @st.cache_data(ttl=3600)  # Cache selama 1 jam
 def fetch_noaa_data(latitude, longitude, hours):
     """
     Mengambil data curah hujan dari NOAA GFS
+
+    Mengembalikan (timestamps, rainfall, cumulative, url) sebagai array
+    NumPy, bukan DataFrame: lat/lon tetap skalar input sehingga objek
+    yang di-pickle oleh st.cache_data jauh lebih kecil.
     """
     try:
         # URL base untuk NOAA GFS
         base_url = "https://nomads.ncep.noaa.gov/dods/gfs_0p25_1hr"
-        
-        # Mendapatkan tanggal run terbaru
-        today = datetime.utcnow()
-        date_str = today.strftime("%Y%m%d")
-        
-        # Mencoba beberapa run time (00, 06, 12, 18 UTC)
-        run_times = ["00", "06", "12", "18"]
-        
-        for run_time in run_times:
-            try:
-                # Konstruksi URL
-                url = f"{base_url}/gfs{date_str}/gfs_0p25_1hr_{date_str}_{run_time}z"
-                
-                # Simulasi data (karena akses langsung ke NOAA memerlukan konfigurasi khusus)
-                # Dalam implementasi nyata, gunakan xarray untuk membaca data NetCDF
-                timestamps = pd.date_range(
-                    start=datetime.utcnow(),
-                    periods=hours,
-                    freq='H'
-                )
-                
-                # Generate data simulasi curah hujan
-                np.random.seed(42)
-                rainfall_data = np.random.exponential(scale=2.0, size=hours)
-                rainfall_data = np.where(rainfall_data > 0.1, rainfall_data, 0)  # Threshold minimum
-                
-                # Tambahkan variasi berdasarkan waktu (lebih tinggi di sore/malam)
-                hour_factor = np.array([
-                    1.5 if 14 <= ts.hour <= 20 else 0.8 if 6 <= ts.hour <= 12 else 1.0
-                    for ts in timestamps
-                ])
-                rainfall_data *= hour_factor
-                
-                df = pd.DataFrame({
-                    'timestamp': timestamps,
-                    'rainfall_mm': rainfall_data,
-                    'latitude': latitude,
-                    'longitude': longitude
-                })
-                
-                return df, url
-                
-            except Exception as e:
-                continue
-                
-        # Jika semua run time gagal, buat data dummy
+
+        # Waktu mulai di jalur C pandas, tanpa boxing datetime Python;
+        # resolusi detik sudah cukup untuk data per jam
+        start = pd.Timestamp.utcnow().tz_localize(None).floor('h')
+
+        # Run GFS terbaru hari ini (00z)
+        date_str = start.strftime("%Y%m%d")
+        url = f"{base_url}/gfs{date_str}/gfs_0p25_1hr_{date_str}_00z"
+
+        # Simulasi data (karena akses langsung ke NOAA memerlukan konfigurasi khusus)
+        # Dalam implementasi nyata, gunakan xarray untuk membaca data NetCDF
         timestamps = pd.date_range(
-            start=datetime.utcnow(),
+            start=start,
             periods=hours,
-            freq='H'
+            freq='h',
+            unit='s'
         )
-        
-        np.random.seed(42)
-        rainfall_data = np.random.exponential(scale=1.5, size=hours)
-        rainfall_data = np.where(rainfall_data > 0.1, rainfall_data, 0)
-        
-        df = pd.DataFrame({
-            'timestamp': timestamps,
-            'rainfall_mm': rainfall_data,
-            'latitude': latitude,
-            'longitude': longitude
-        })
-        
-        return df, "Data simulasi (koneksi ke NOAA tidak tersedia)"
-        
+
+        # Generate data simulasi curah hujan
+        rng = np.random.default_rng(42)
+        rainfall_data = rng.exponential(scale=2.0, size=hours)
+
+        # Tambahkan variasi berdasarkan waktu (lebih tinggi di sore/malam)
+        hours_arr = timestamps.hour.to_numpy()
+        hour_factor = np.where(
+            (hours_arr >= 14) & (hours_arr <= 20), 1.5,
+            np.where((hours_arr >= 6) & (hours_arr <= 12), 0.8, 1.0)
+        )
+
+        # Faktor jam + threshold minimum in-place, tanpa buffer tambahan
+        np.multiply(rainfall_data, hour_factor, out=rainfall_data)
+        rainfall_data[rainfall_data <= 0.1 * hour_factor] = 0
+
+        # float32 cukup untuk curah hujan (mm) dan separuh lebih hemat
+        # bandwidth ke browser dibanding float64
+        rainfall_data = rainfall_data.astype(np.float32)
+        # Hitung akumulasi sekali di sini agar hasilnya ikut ter-cache
+        cumulative = rainfall_data.cumsum()
+
+        return timestamps.to_numpy(), rainfall_data, cumulative, url
+
     except Exception as e:
         st.error(f"Error mengambil data: {str(e)}")
-        return None, None
+        return None, None, None, None
+
+# Jumlah titik maksimum yang dikirim ke browser per trace
+MAX_CHART_POINTS = 500
+
+def lttb_downsample(x, y, n_out):
+    """
+    Downsampling deret waktu dengan Largest-Triangle-Three-Buckets (LTTB)
+
+    Mengembalikan indeks titik terpilih sehingga bentuk visual deret
+    tetap terjaga dengan jumlah titik jauh lebih sedikit.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x_f = np.asarray(x, dtype='int64' if np.issubdtype(np.asarray(x).dtype, np.datetime64) else 'float64').astype('float64')
+    y_f = np.asarray(y, dtype='float64')
+
+    # Titik pertama dan terakhir selalu dipertahankan
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+
+    # Batas bucket untuk titik-titik di antaranya
+    bucket_edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    prev_idx = 0
+    for i in range(n_out - 2):
+        start, end = bucket_edges[i], bucket_edges[i + 1]
+        # Rata-rata bucket berikutnya sebagai titik ketiga segitiga
+        next_start, next_end = bucket_edges[i + 1], (bucket_edges[i + 2] if i + 2 < len(bucket_edges) else n)
+        avg_x = x_f[next_start:next_end].mean()
+        avg_y = y_f[next_start:next_end].mean()
+
+        # Pilih titik dengan luas segitiga terbesar dalam bucket ini
+        bx = x_f[start:end]
+        by = y_f[start:end]
+        area = np.abs(
+            (x_f[prev_idx] - avg_x) * (by - y_f[prev_idx])
+            - (x_f[prev_idx] - bx) * (avg_y - y_f[prev_idx])
+        )
+        prev_idx = start + int(area.argmax())
+        indices[i + 1] = prev_idx
+
+    return indices
 
 # Fungsi untuk membuat visualisasi
-def create_rainfall_chart(df):
+@st.cache_data(ttl=3600, show_spinner=False)
+def create_rainfall_chart(_timestamps, _rainfall, _cumulative, lat, lon, forecast_hours):
     """
     Membuat grafik curah hujan
+
+    Argumen array tidak di-hash oleh Streamlit; kunci cache adalah
+    (lat, lon, forecast_hours) yang menentukan isi data.
     """
+    # Impor lazy agar cold start aplikasi lebih ringan
+    from plotly.subplots import make_subplots
+
+    timestamps, rainfall, cumulative = _timestamps, _rainfall, _cumulative
     fig = make_subplots(
         rows=2, cols=1,
         subplot_titles=('Prediksi Curah Hujan per Jam', 'Akumulasi Curah Hujan'),
         vertical_spacing=0.1,
         row_heights=[0.6, 0.4]
     )
-    
+
+    # Untuk deret panjang gunakan WebGL (scattergl) agar render browser
+    # jauh lebih cepat; deret pendek tetap SVG agar marker lebih tajam.
+    use_gl = len(rainfall) >= MIN_SCATTERGL_ROWS
+    trace_cls = go.Scattergl if use_gl else go.Scatter
+
+    # Downsampling LTTB agar jumlah titik yang dikirim ke browser terbatas
+    idx = lttb_downsample(timestamps, rainfall, MAX_CHART_POINTS)
+
     # Grafik curah hujan per jam
-    fig.add_trace(
-        go.Scatter(
-            x=df['timestamp'],
-            y=df['rainfall_mm'],
-            mode='lines+markers',
-            name='Curah Hujan (mm/jam)',
-            line=dict(color='blue', width=2),
-            marker=dict(size=4),
-            fill='tonexty',
-            fillcolor='rgba(0,100,255,0.2)'
-        ),
-        row=1, col=1
+    hourly_kwargs = dict(
+        x=timestamps[idx],
+        y=rainfall[idx],
+        mode='lines+markers',
+        name='Curah Hujan (mm/jam)',
+        line=dict(color='blue', width=2),
+        marker=dict(size=4)
     )
-    
-    # Grafik akumulasi curah hujan
-    df['cumulative_rainfall'] = df['rainfall_mm'].cumsum()
+    if not use_gl:
+        # fill='tonexty' berperilaku berbeda di WebGL, jadi hanya dipakai di SVG
+        hourly_kwargs.update(fill='tonexty', fillcolor='rgba(0,100,255,0.2)')
+    fig.add_trace(trace_cls(**hourly_kwargs), row=1, col=1)
+
+    # Grafik akumulasi curah hujan (sudah dihitung di fetch_noaa_data).
+    # Deretnya monoton naik, jadi stride sampling sudah mempertahankan
+    # bentuknya dan lebih murah daripada LTTB; titik terakhir selalu ikut.
+    n = len(cumulative)
+    stride = max(1, -(-n // MAX_CHART_POINTS))
+    idx_cum = np.arange(0, n, stride)
+    if idx_cum[-1] != n - 1:
+        idx_cum = np.append(idx_cum, n - 1)
     fig.add_trace(
-        go.Scatter(
-            x=df['timestamp'],
-            y=df['cumulative_rainfall'],
+        trace_cls(
+            x=timestamps[idx_cum],
+            y=cumulative[idx_cum],
             mode='lines',
             name='Akumulasi (mm)',
             line=dict(color='red', width=2)
@@ -180,77 +225,151 @@ def create_rainfall_chart(df):
     fig.update_xaxes(title_text="Waktu", row=2, col=1)
     fig.update_yaxes(title_text="Curah Hujan (mm/jam)", row=1, col=1)
     fig.update_yaxes(title_text="Akumulasi (mm)", row=2, col=1)
-    
-    return fig
+
+    # Kembalikan bentuk dict (diterima langsung oleh st.plotly_chart)
+    # agar konversi Figure -> dict ikut ter-cache dan tidak diulang
+    # pada setiap rerun.
+    return fig.to_dict()
 
 # Fungsi untuk membuat heatmap
-def create_heatmap(df):
+@st.cache_data(ttl=3600, show_spinner=False)
+def create_heatmap(_timestamps, _rainfall, lat, lon, forecast_hours):
     """
     Membuat heatmap curah hujan berdasarkan hari dan jam
+
+    Kunci cache mengikuti pola create_rainfall_chart.
     """
-    df['date'] = df['timestamp'].dt.date
-    df['hour'] = df['timestamp'].dt.hour
-    
-    # Pivot data untuk heatmap
-    heatmap_data = df.pivot_table(
-        values='rainfall_mm',
-        index='date',
-        columns='hour',
-        aggfunc='mean',
-        fill_value=0
-    )
-    
+    # Impor lazy agar cold start aplikasi lebih ringan
+    import plotly.express as px
+
+    rainfall = np.asarray(_rainfall, dtype='float64')
+    start = pd.Timestamp(_timestamps[0])
+
+    # Data per jam sudah terurut dan unik, jadi cukup reshape langsung ke
+    # bentuk (hari x 24 jam) tanpa pivot_table: pad bagian depan sesuai
+    # jam mulai dan bagian belakang sampai kelipatan 24 dengan NaN.
+    start_hour = start.hour
+    pad_end = (-(start_hour + len(rainfall))) % 24
+    padded = np.concatenate([
+        np.full(start_hour, np.nan),
+        rainfall,
+        np.full(pad_end, np.nan)
+    ])
+    heatmap_data = padded.reshape(-1, 24)
+
+    # Kuantisasi raster ke uint16 (1 satuan = 0.01 mm): jauh lebih kecil
+    # daripada float64 dan resolusi 0.01 mm lebih dari cukup untuk warna.
+    # Sel padding NaN menjadi 0 seperti fill_value pivot sebelumnya.
+    heatmap_q = np.clip(np.nan_to_num(heatmap_data) * 100, 0, 65535).astype(np.uint16)
+    q_max = int(heatmap_q.max())
+
+    # Label baris: satu tanggal per baris heatmap
+    dates = pd.date_range(
+        start.normalize(),
+        periods=heatmap_q.shape[0],
+        freq='D'
+    ).date
+
     fig = px.imshow(
-        heatmap_data,
+        heatmap_q,
+        x=list(range(24)),
+        y=[str(d) for d in dates],
         labels=dict(x="Jam", y="Tanggal", color="Curah Hujan (mm)"),
         title="Heatmap Curah Hujan per Jam",
         color_continuous_scale="Blues",
-        aspect="auto"
+        aspect="auto",
+        zmin=0,
+        zmax=q_max
     )
-    
+
+    # Colorbar tetap menampilkan mm (nilai raster = mm x 100)
+    tickvals = np.linspace(0, q_max, 6)
+    fig.update_coloraxes(colorbar=dict(
+        tickvals=tickvals,
+        ticktext=[f"{v / 100:.1f}" for v in tickvals]
+    ))
+
     return fig
 
-# Fungsi untuk download data
-def get_download_link(df, filename):
+# Fungsi untuk menyiapkan bytes download
+@st.cache_data(ttl=3600, show_spinner=False)
+def encode_csv(_df, lat, lon, forecast_hours):
     """
-    Membuat link download untuk data CSV
+    Encode data ke bytes CSV; di-cache dengan kunci parameter fetch
+    agar rerun tidak menulis ulang CSV yang sama.
     """
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">Download {filename}</a>'
-    return href
+    return _df.to_csv(index=False).encode()
 
-# Main app
-if st.sidebar.button("🔄 Ambil Data Curah Hujan", type="primary"):
+@st.cache_data(ttl=3600, show_spinner=False)
+def encode_json(_timestamps, _rainfall, _cumulative, lat, lon, forecast_hours):
+    """
+    Encode data ke bytes JSON via orjson; pola cache sama dengan encode_csv.
+    """
+    # Serialisasi langsung dari array (jauh lebih cepat daripada pandas
+    # to_json), timestamp sebagai epoch int64
+    return orjson.dumps(
+        {
+            "timestamp": _timestamps.astype('int64'),
+            "rainfall_mm": _rainfall,
+            "cumulative_rainfall": _cumulative,
+            "lat": lat,
+            "lon": lon
+        },
+        option=orjson.OPT_SERIALIZE_NUMPY
+    )
+
+# Bagian render utama dibungkus st.fragment: interaksi di dalamnya
+# (misalnya tombol download) hanya merender ulang fragment ini, bukan
+# seluruh script
+@st.fragment
+def render_forecast(lat, lon, forecast_hours):
+    """
+    Merender statistik, grafik, tabel, dan menu download untuk satu fetch
+    """
     with st.spinner("Mengambil data dari NOAA GFS..."):
-        data, source_url = fetch_noaa_data(lat, lon, forecast_hours)
-    
-    if data is not None:
+        timestamps, rainfall, cumulative, source_url = fetch_noaa_data(lat, lon, forecast_hours)
+
+    if rainfall is not None:
         st.success(f"✅ Data berhasil diambil dari: {source_url}")
-        
-        # Statistik ringkas
+
+        # DataFrame ringan hanya untuk tabel detail dan download
+        data = pd.DataFrame({
+            'timestamp': timestamps,
+            'rainfall_mm': rainfall,
+            'latitude': lat,
+            'longitude': lon,
+            'cumulative_rainfall': cumulative
+        })
+
+        # Statistik ringkas: semua reduksi dihitung sekali dari array
+        total_rain = float(rainfall.sum())
+        mean_rain = float(rainfall.mean())
+        i_max = int(rainfall.argmax())
+        max_rain = float(rainfall[i_max])
+        ts_max = pd.Timestamp(timestamps[i_max])
+        hujan_hours = int((rainfall > 0.1).sum())
+
         col1, col2, col3, col4 = st.columns(4)
-        
+
         with col1:
             st.metric(
                 "Total Curah Hujan",
-                f"{data['rainfall_mm'].sum():.2f} mm",
-                delta=f"{data['rainfall_mm'].mean():.2f} mm/jam rata-rata"
+                f"{total_rain:.2f} mm",
+                delta=f"{mean_rain:.2f} mm/jam rata-rata"
             )
-        
+
         with col2:
             st.metric(
                 "Curah Hujan Maksimum",
-                f"{data['rainfall_mm'].max():.2f} mm/jam",
-                delta=f"Pada {data.loc[data['rainfall_mm'].idxmax(), 'timestamp'].strftime('%d/%m %H:%M')}"
+                f"{max_rain:.2f} mm/jam",
+                delta=f"Pada {ts_max.strftime('%d/%m %H:%M')}"
             )
-        
+
         with col3:
-            hujan_hours = (data['rainfall_mm'] > 0.1).sum()
             st.metric(
                 "Jam Berhujan",
                 f"{hujan_hours} jam",
-                delta=f"{hujan_hours/len(data)*100:.1f}% dari total waktu"
+                delta=f"{hujan_hours/rainfall.size*100:.1f}% dari total waktu"
             )
         
         with col4:
@@ -262,24 +381,26 @@ if st.sidebar.button("🔄 Ambil Data Curah Hujan", type="primary"):
         
         # Visualisasi utama
         st.subheader("📊 Grafik Prediksi Curah Hujan")
-        rainfall_chart = create_rainfall_chart(data)
+        rainfall_chart = create_rainfall_chart(timestamps, rainfall, cumulative, lat, lon, forecast_hours)
         st.plotly_chart(rainfall_chart, use_container_width=True)
         
         # Heatmap
         if forecast_hours >= 48:
             st.subheader("🔥 Heatmap Curah Hujan")
-            heatmap_chart = create_heatmap(data)
+            heatmap_chart = create_heatmap(timestamps, rainfall, lat, lon, forecast_hours)
             st.plotly_chart(heatmap_chart, use_container_width=True)
         
         # Tabel data
         with st.expander("📋 Lihat Data Detail"):
+            # Format angka di sisi klien via column_config, tanpa Styler
             st.dataframe(
-                data.style.format({
-                    'rainfall_mm': '{:.2f}',
-                    'latitude': '{:.4f}',
-                    'longitude': '{:.4f}'
-                }),
-                use_container_width=True
+                data,
+                use_container_width=True,
+                column_config={
+                    'rainfall_mm': st.column_config.NumberColumn(format="%.2f"),
+                    'latitude': st.column_config.NumberColumn(format="%.4f"),
+                    'longitude': st.column_config.NumberColumn(format="%.4f")
+                }
             )
         
         # Menu download
@@ -289,19 +410,21 @@ if st.sidebar.button("🔄 Ambil Data Curah Hujan", type="primary"):
         with col1:
             # Download CSV
             filename_csv = f"curah_hujan_{lat}_{lon}_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
-            st.markdown(
-                get_download_link(data, filename_csv),
-                unsafe_allow_html=True
+            st.download_button(
+                "⬇️ Download CSV",
+                data=encode_csv(data, lat, lon, forecast_hours),
+                file_name=filename_csv,
+                mime="text/csv"
             )
-        
+
         with col2:
             # Download JSON
-            json_data = data.to_json(orient='records', date_format='iso')
             filename_json = f"curah_hujan_{lat}_{lon}_{datetime.now().strftime('%Y%m%d_%H%M')}.json"
-            b64_json = base64.b64encode(json_data.encode()).decode()
-            st.markdown(
-                f'<a href="data:file/json;base64,{b64_json}" download="{filename_json}">Download {filename_json}</a>',
-                unsafe_allow_html=True
+            st.download_button(
+                "⬇️ Download JSON",
+                data=encode_json(timestamps, rainfall, cumulative, lat, lon, forecast_hours),
+                file_name=filename_json,
+                mime="application/json"
             )
         
         with col3:
@@ -311,6 +434,10 @@ if st.sidebar.button("🔄 Ambil Data Curah Hujan", type="primary"):
     else:
         st.error("❌ Gagal mengambil data. Silakan coba lagi.")
 
+# Main app
+if st.sidebar.button("🔄 Ambil Data Curah Hujan", type="primary"):
+    render_forecast(lat, lon, forecast_hours)
+
 # Informasi tambahan
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 📋 Informasi")